@@ -3,7 +3,13 @@
 Script para diagnosticar los nombres exactos de los campos en Odoo producción.
 Usado para encontrar los nombres correctos de campos personalizados.
 """
-import json
+import io
+import re
+import sys
+import time
+from contextlib import redirect_stdout
+
+import orjson
 from odoo_rpc import _post
 from dotenv import load_dotenv
 import os
@@ -14,12 +20,80 @@ ODOO_DB = os.getenv("ODOO_DB")
 ODOO_UID = int(os.getenv("ODOO_UID"))
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
 
+# Cache del fields_get: evita repetir el RPC (~1000+ campos) en corridas
+# seguidas. En memoria por (db, modelo) con TTL, y persistido a disco para
+# que una segunda ejecución del script ni siquiera toque la red.
+FIELDS_CACHE_FILE = "odoo_fields_cache.json"
+FIELDS_CACHE_TTL = 3600  # 1 hora
+_fields_cache: dict = {}
+
+
+def _fields_cache_key(model: str, attributes=None, field_names=None) -> str:
+    attrs = ",".join(attributes or [])
+    names = ",".join(field_names or [])
+    return f"{ODOO_DB}:{model}:{attrs}:{names}"
 
-def get_all_fields_for_partner(partner_id: int):
+
+def _load_fields_cache(key: str):
+    """Devuelve el fields_get cacheado (memoria o disco) si sigue vigente."""
+    if os.getenv("ODOO_FIELDS_CACHE_BUST") == "1":
+        return None
+    entry = _fields_cache.get(key)
+    if entry is None and os.path.exists(FIELDS_CACHE_FILE):
+        try:
+            with open(FIELDS_CACHE_FILE, "rb") as f:
+                entry = orjson.loads(f.read()).get(key)
+        except (OSError, orjson.JSONDecodeError):
+            entry = None
+        if entry:
+            # De vuelta a memoria: si no, la próxima escritura a disco
+            # (que parte de _fields_cache) perdería esta entrada
+            _fields_cache[key] = entry
+    if not entry:
+        return None
+    ts, data = entry
+    if time.time() - ts > FIELDS_CACHE_TTL:
+        return None
+    return data
+
+
+def _store_fields_cache(key: str, data: dict):
+    _fields_cache[key] = (time.time(), data)
+    # Merge con lo que ya hay en disco: reescribir solo desde memoria
+    # clobbearía las claves de corridas anteriores que nunca se leyeron
+    merged: dict = {}
+    if os.path.exists(FIELDS_CACHE_FILE):
+        try:
+            with open(FIELDS_CACHE_FILE, "rb") as f:
+                on_disk = orjson.loads(f.read())
+            if isinstance(on_disk, dict):
+                merged = on_disk
+        except (OSError, orjson.JSONDecodeError):
+            merged = {}
+    merged.update(_fields_cache)
+    try:
+        with open(FIELDS_CACHE_FILE, "wb") as f:
+            f.write(orjson.dumps(merged))
+    except OSError:
+        pass  # el cache en disco es best-effort
+
+
+def get_all_fields_for_partner(partner_id: int, field_names=None, attributes=None):
     """
-    Lee TODOS los campos disponibles para un partner específico.
+    Lee los campos disponibles para un partner específico.
     Esto nos muestra qué campos existen realmente en Odoo.
+
+    Por defecto pide solo "string": es el único atributo que usa el matching
+    y reduce mucho el payload (~1000 campos). Para los candidatos ya
+    filtrados se puede pedir el detalle completo pasando `field_names`.
     """
+    if attributes is None:
+        attributes = ["string"]
+    key = _fields_cache_key("res.partner", attributes, field_names)
+    cached = _load_fields_cache(key)
+    if cached is not None:
+        return cached
+
     payload = {
         "jsonrpc": "2.0",
         "id": 100,
@@ -33,8 +107,8 @@ def get_all_fields_for_partner(partner_id: int):
                 ODOO_PASSWORD,
                 "res.partner",
                 "fields_get",
-                [],
-                {"attributes": ["string", "type", "required", "readonly"]},
+                [field_names or []],
+                {"attributes": attributes},
             ],
         },
     }
@@ -44,24 +118,64 @@ def get_all_fields_for_partner(partner_id: int):
         print(f"❌ Error obteniendo campos: {result}")
         return None
 
-    return result.get("result", {})
+    fields = result.get("result", {})
+    if fields:
+        _store_fields_cache(key, fields)
+    return fields
+
+
+try:
+    import ahocorasick  # pyahocorasick: escaneo multi-keyword en una sola pasada
+except ImportError:
+    ahocorasick = None
 
 
 def search_fields_by_keywords(fields_dict: dict, keywords: list):
     """
     Busca campos que contengan ciertas palabras clave.
+
+    Con pyahocorasick disponible, cada etiqueta/nombre se recorre una sola
+    vez contra todas las keywords (DFA) en lugar de un `in` por keyword.
     """
+    keywords_lower = [kw.lower() for kw in keywords]
     matches = {}
-    for field_name, field_info in fields_dict.items():
-        field_label = field_info.get("string", "").lower()
-        for keyword in keywords:
-            if keyword.lower() in field_label or keyword.lower() in field_name.lower():
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for kw in keywords_lower:
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        for field_name, field_info in fields_dict.items():
+            hay = (field_info.get("string", "") + "\x00" + field_name).lower()
+            if next(automaton.iter(hay), None) is not None:
                 matches[field_name] = field_info
-                break
+        return matches
+
+    # Fallback sin pyahocorasick: una alternación compilada escanea cada
+    # string en una sola pasada a nivel C, sin loop Python por keyword.
+    pat = re.compile("|".join(re.escape(k) for k in keywords_lower), re.IGNORECASE)
+    for field_name, field_info in fields_dict.items():
+        if pat.search(field_info.get("string", "")) or pat.search(field_name):
+            matches[field_name] = field_info
     return matches
 
 
 def main():
+    # Todo el reporte se arma en un buffer y se emite con un solo write:
+    # ~50 prints línea-a-línea se vuelven una única syscall de salida.
+    # El flush va en finally: si _run_report explota a mitad del diagnóstico,
+    # lo avanzado se imprime igual antes del traceback (como con los prints
+    # progresivos de antes).
+    out = io.StringIO()
+    try:
+        with redirect_stdout(out):
+            _run_report()
+    finally:
+        sys.stdout.write(out.getvalue())
+        sys.stdout.flush()
+
+
+def _run_report():
     print("=" * 80)
     print("DIAGNÓSTICO DE CAMPOS ODOO - PRODUCCIÓN")
     print("=" * 80)
@@ -98,6 +212,27 @@ def main():
 
     matches = search_fields_by_keywords(all_fields, keywords)
 
+    # Segundo fields_get, ya dirigido: tipo/required/readonly solo para la
+    # docena de candidatos que pasaron el filtro, no para los ~1000 campos.
+    if matches:
+        details = get_all_fields_for_partner(
+            0,
+            field_names=sorted(matches),
+            attributes=["string", "type", "required", "readonly"],
+        )
+        if details:
+            matches = {fn: details.get(fn, fi) for fn, fi in matches.items()}
+
+    # Corpus en minúsculas materializado una sola vez: los escaneos de
+    # candidatos y de campos similares lo reutilizan en vez de re-lowercasear
+    # los mismos strings en cada pasada.
+    all_fields_lower = [
+        (fn, fn.lower(), fi.get("string", "").lower()) for fn, fi in all_fields.items()
+    ]
+    matches_lower = [
+        (fn, fn.lower(), fi.get("string", "").lower()) for fn, fi in matches.items()
+    ]
+
     print("=" * 80)
     print(f"📌 CAMPOS ENCONTRADOS ({len(matches)}):")
     print("=" * 80)
@@ -132,13 +267,12 @@ def main():
         if field_name not in all_fields:
             # Buscar campos similares
             similar = []
-            search_term = field_name.replace("x_studio_", "").replace("_", " ")
-            for fn, fi in all_fields.items():
-                if (
-                    search_term.lower() in fn.lower()
-                    or search_term.lower() in fi.get("string", "").lower()
-                ):
-                    similar.append((fn, fi.get("string")))
+            search_term = (
+                field_name.replace("x_studio_", "").replace("_", " ").lower()
+            )
+            for fn, fn_lower, label_lower in all_fields_lower:
+                if search_term in fn_lower or search_term in label_lower:
+                    similar.append((fn, all_fields[fn].get("string")))
 
             if similar:
                 print(f"   💡 Campos similares encontrados:")
@@ -152,9 +286,9 @@ def main():
 
     # Intentar encontrar el campo correcto para nombre comercial
     comercial_candidates = [
-        k
-        for k, v in matches.items()
-        if "comercial" in k.lower() or "comercial" in v.get("string", "").lower()
+        fn
+        for fn, fn_lower, label_lower in matches_lower
+        if "comercial" in fn_lower or "comercial" in label_lower
     ]
     if comercial_candidates:
         print(f'ODOO_FIELD_NOMBRE_COMERCIAL = "{comercial_candidates[0]}"')
@@ -163,7 +297,9 @@ def main():
         print('# ODOO_FIELD_NOMBRE_COMERCIAL = "???"')
 
     # Intentar encontrar el campo correcto para fecha de matrícula
-    matricula_candidates = [k for k, v in matches.items() if "matricula" in k.lower()]
+    matricula_candidates = [
+        fn for fn, fn_lower, _ in matches_lower if "matricula" in fn_lower
+    ]
     if matricula_candidates:
         print(f'ODOO_FIELD_FECHA_MATRICULA = "{matricula_candidates[0]}"')
     else:
@@ -171,7 +307,7 @@ def main():
         print('# ODOO_FIELD_FECHA_MATRICULA = "???"')
 
     # Intentar encontrar el campo correcto para CIIU
-    ciiu_candidates = [k for k, v in matches.items() if "ciiu" in k.lower()]
+    ciiu_candidates = [fn for fn, fn_lower, _ in matches_lower if "ciiu" in fn_lower]
     if ciiu_candidates:
         print(f'ODOO_FIELD_CIIU = "{ciiu_candidates[0]}"')
     else:
@@ -182,18 +318,18 @@ def main():
 
     # Guardar resultado completo en JSON
     output_file = "odoo_fields_diagnostics.json"
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(
-            {
-                "all_fields_count": len(all_fields),
-                "matches": {k: v for k, v in matches.items()},
-                "current_fields_status": {
-                    field: (field in all_fields) for field in current_fields.keys()
+    with open(output_file, "wb") as f:
+        f.write(
+            orjson.dumps(
+                {
+                    "all_fields_count": len(all_fields),
+                    "matches": matches,
+                    "current_fields_status": {
+                        field: (field in all_fields) for field in current_fields.keys()
+                    },
                 },
-            },
-            f,
-            indent=2,
-            ensure_ascii=False,
+                option=orjson.OPT_INDENT_2,
+            )
         )
 
     print(f"\n💾 Diagnóstico completo guardado en: {output_file}")
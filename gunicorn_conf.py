@@ -0,0 +1,16 @@
+# gunicorn_conf.py
+# Arranque: gunicorn -c gunicorn_conf.py rues_scraper:app
+# El servicio es I/O-bound (Socrata, RUES, Odoo), así que gthread con muchos
+# hilos rinde mejor que workers sync: los hilos quedan bloqueados en red,
+# no compitiendo por CPU.
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(2 * multiprocessing.cpu_count() + 1)))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+keepalive = 30
+# tmpfs para los heartbeats de los workers: evita stalls por disco lento
+worker_tmp_dir = "/dev/shm"
+accesslog = "-"
@@ -1,26 +1,83 @@
 # odoo_rpc.py
+import gzip
+import orjson
 import requests
 import logging
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List
 import os
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 import config  # Carga configuración según USE_PRODUCTION
 
-ODOO_JSONRPC = os.getenv("ODOO_JSONRPC")
-ODOO_DB = os.getenv("ODOO_DB")
-ODOO_UID = int(os.getenv("ODOO_UID"))
-ODOO_PASSWORD = os.getenv("ODOO_PASSWORD")
+# Validación única al importar: falla con un mensaje claro si falta algo,
+# en vez del TypeError críptico de int(None) en medio del arranque.
+_REQUIRED_ENV = ("ODOO_JSONRPC", "ODOO_DB", "ODOO_UID", "ODOO_PASSWORD")
+_missing = [name for name in _REQUIRED_ENV if not os.getenv(name)]
+if _missing:
+    raise RuntimeError(
+        f"Faltan variables de entorno Odoo: {', '.join(_missing)} (revisa el .env)"
+    )
+
+ODOO_JSONRPC = os.environ["ODOO_JSONRPC"]
+ODOO_DB = os.environ["ODOO_DB"]
+try:
+    ODOO_UID = int(os.environ["ODOO_UID"])
+except ValueError:
+    raise RuntimeError(
+        f"ODOO_UID debe ser un entero, no {os.environ['ODOO_UID']!r} (revisa el .env)"
+    ) from None
+ODOO_PASSWORD = os.environ["ODOO_PASSWORD"]
 
 log = logging.getLogger("odoo_rpc")
 
+# Sesión persistente: reutiliza la conexión TCP/TLS entre llamadas RPC
+# (keep-alive) en lugar de renegociar el handshake en cada requests.post.
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=50,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+_SESSION.headers.update(
+    {
+        "Content-Type": "application/json",
+        "Connection": "keep-alive",
+        # Respuestas JSON-RPC (claves repetidas) comprimen ~5-10x. Solo gzip:
+        # anunciar br sin un decoder brotli instalado haría que urllib3
+        # entregue el body sin descomprimir y el parseo JSON fallaría.
+        "Accept-Encoding": "gzip",
+    }
+)
+
+# Compresión del request body: opt-in porque requiere que Odoo esté detrás
+# de un proxy que descomprima Content-Encoding: gzip.
+_GZIP_REQUESTS = os.getenv("ODOO_GZIP_REQUESTS", "false").lower() in ("true", "1", "yes")
+_GZIP_MIN_BYTES = 4096
+
+
+def _post_body(body: bytes, timeout: int = 20):
+    """POST crudo a ODOO_JSONRPC comprimiendo el body grande si está habilitado."""
+    if _GZIP_REQUESTS and len(body) >= _GZIP_MIN_BYTES:
+        return _SESSION.post(
+            ODOO_JSONRPC,
+            data=gzip.compress(body),
+            headers={"Content-Encoding": "gzip"},
+            timeout=timeout,
+        )
+    return _SESSION.post(ODOO_JSONRPC, data=body, timeout=timeout)
+
 
 def _post(payload: dict) -> Tuple[bool, dict]:
     try:
-        r = requests.post(ODOO_JSONRPC, json=payload, timeout=20)
+        r = _post_body(orjson.dumps(payload))
         status = r.status_code
         text = r.text
         r.raise_for_status()
-        data = r.json()
+        data = orjson.loads(r.content)
     except requests.exceptions.RequestException as e:
         return False, {"error": "http_error", "detail": str(e)}
     except ValueError:
@@ -30,51 +87,69 @@ def _post(payload: dict) -> Tuple[bool, dict]:
     return True, data
 
 
+# Esqueleto del payload congelado al importar: la forma nunca cambia entre
+# llamadas, así que solo se copia y se rellena `id`/`args` en el hot path.
+_RPC_TMPL = {"jsonrpc": "2.0", "id": 1, "method": "call", "params": None}
+_ARGS_PREFIX = [ODOO_DB, ODOO_UID, ODOO_PASSWORD, "res.partner"]
+
+
+def _execute_kw_payload(method: str, args: list, call_id: int = 1) -> dict:
+    """Arma el payload JSON-RPC estándar para execute_kw sobre res.partner."""
+    payload = _RPC_TMPL.copy()
+    payload["id"] = call_id
+    payload["params"] = {
+        "service": "object",
+        "method": "execute_kw",
+        "args": _ARGS_PREFIX + [method, *args],
+    }
+    return payload
+
+
 def post_write(
     partner_id: int, field_name: str, url_value: Optional[str]
 ) -> Tuple[bool, dict]:
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "method": "call",
-        "params": {
-            "service": "object",
-            "method": "execute_kw",
-            "args": [
-                ODOO_DB,
-                ODOO_UID,
-                ODOO_PASSWORD,
-                "res.partner",
-                "write",
-                [[partner_id], {field_name: url_value}],
-            ],
-        },
-    }
-    log.info({"event": "odoo_post_write_payload", "payload": payload})
+    payload = _execute_kw_payload("write", [[[partner_id], {field_name: url_value}]], 1)
+    # Solo un resumen compacto: el payload completo incluye la contraseña y
+    # su repr() es caro en el hot path.
+    log.info({"event": "odoo_post_write", "partner_id": partner_id, "n_fields": 1})
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            {
+                "event": "odoo_post_write_payload",
+                "partner_id": partner_id,
+                "fields": [field_name],
+            }
+        )
     return _post(payload)
 
 
 def read_fields(partner_id: int, fields: list[str]) -> Tuple[bool, dict]:
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 2,
-        "method": "call",
-        "params": {
-            "service": "object",
-            "method": "execute_kw",
-            "args": [
-                ODOO_DB,
-                ODOO_UID,
-                ODOO_PASSWORD,
-                "res.partner",
-                "read",
-                [[partner_id], fields],
-            ],
-        },
-    }
+    payload = _execute_kw_payload("read", [[[partner_id], fields]], 2)
     return _post(payload)
 
 
+# Límite de ids por `read` para mantener el request dentro de límites de Odoo
+READ_CHUNK_SIZE = 500
+
+
+def read_fields_many(ids: List[int], fields: list[str]) -> Tuple[bool, list]:
+    """
+    Lee varios partners en una sola llamada `read` (Odoo acepta la lista de
+    ids nativamente) en lugar de un RPC por partner. Trocea en bloques de
+    READ_CHUNK_SIZE ids. Devuelve (ok, registros); si un bloque falla se
+    devuelve (False, detalle_del_error).
+    """
+    records: list = []
+    for start in range(0, len(ids), READ_CHUNK_SIZE):
+        chunk = list(ids[start : start + READ_CHUNK_SIZE])
+        payload = _execute_kw_payload("read", [[chunk, fields]], 3)
+        ok, data = _post(payload)
+        if not ok:
+            return False, data
+        records.extend(data.get("result") or [])
+    return True, records
+
+
 def post_write_multi(partner_id: int, vals: dict) -> Tuple[bool, dict]:
     """
     Escribe varios campos en una sola llamada Odoo JSON-RPC.
@@ -82,42 +157,80 @@ def post_write_multi(partner_id: int, vals: dict) -> Tuple[bool, dict]:
     """
     if not isinstance(vals, dict):
         vals = {}
-    payload = {
-        "jsonrpc": "2.0",
-        "id": 7,
-        "method": "call",
-        "params": {
-            "service": "object",
-            "method": "execute_kw",
-            "args": [
-                ODOO_DB,
-                ODOO_UID,
-                ODOO_PASSWORD,
-                "res.partner",
-                "write",
-                [[partner_id], vals],
-            ],
-        },
-    }
-    logging.getLogger("odoo_rpc").info(
-        {"event": "odoo_post_write_multi_payload", "payload": payload}
+    if not vals:
+        # Nada que escribir: no vale la pena el round-trip a Odoo
+        return True, {"result": True, "skipped": "empty_vals"}
+    payload = _execute_kw_payload("write", [[[partner_id], vals]], 7)
+    log.info(
+        {
+            "event": "odoo_post_write_multi",
+            "partner_id": partner_id,
+            "n_fields": len(vals),
+        }
     )
-    try:
-        r = requests.post(ODOO_JSONRPC, json=payload, timeout=20)
-        status = r.status_code
-        text = r.text
-        r.raise_for_status()
-        data = r.json()
-    except requests.exceptions.RequestException as e:
-        return False, {"error": "http_error", "detail": str(e)}
-    except ValueError:
-        return False, {"error": "json_decode_error", "status": status, "body": text}
-
-    if "error" in data:
-        return False, data["error"]
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            {
+                "event": "odoo_post_write_multi_payload",
+                "partner_id": partner_id,
+                "fields": list(vals.keys()),
+            }
+        )
+    ok, data = _post(payload)
+    if not ok:
+        return False, data
     return bool(data.get("result")), data
 
 
+# Tamaño máximo de un batch JSON-RPC (mantener el body bajo los límites de Odoo)
+BATCH_CHUNK_SIZE = 50
+
+
+def post_write_batch(items: List[Tuple[int, dict]]) -> List[Tuple[bool, dict]]:
+    """
+    Escribe varios partners en un solo round-trip HTTP usando un batch JSON-RPC
+    (array de llamadas en el top-level). Odoo responde con un array de
+    resultados; se mapean por `id` para devolverlos en el orden de `items`.
+    Se trocea en bloques de BATCH_CHUNK_SIZE para no exceder límites de body.
+    """
+    results: List[Tuple[bool, dict]] = []
+    for start in range(0, len(items), BATCH_CHUNK_SIZE):
+        chunk = items[start : start + BATCH_CHUNK_SIZE]
+        batch = [
+            _execute_kw_payload("write", [[[pid], vals]], i)
+            for i, (pid, vals) in enumerate(chunk)
+        ]
+        log.info({"event": "odoo_post_write_batch", "calls": len(batch)})
+        try:
+            r = _post_body(orjson.dumps(batch))
+            status = r.status_code
+            text = r.text
+            r.raise_for_status()
+            data = orjson.loads(r.content)
+        except requests.exceptions.RequestException as e:
+            err = {"error": "http_error", "detail": str(e)}
+            results.extend((False, err) for _ in chunk)
+            continue
+        except ValueError:
+            err = {"error": "json_decode_error", "status": status, "body": text}
+            results.extend((False, err) for _ in chunk)
+            continue
+
+        # Algunas versiones responden un objeto único si el batch tiene 1 llamada
+        if isinstance(data, dict):
+            data = [data]
+        by_id = {d.get("id"): d for d in data if isinstance(d, dict)}
+        for i, _ in enumerate(chunk):
+            d = by_id.get(i)
+            if not d:
+                results.append((False, {"error": "missing_response", "id": i}))
+            elif "error" in d:
+                results.append((False, d["error"]))
+            else:
+                results.append((bool(d.get("result")), d))
+    return results
+
+
 if __name__ == "__main__":
     import argparse, json
 
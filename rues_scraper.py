@@ -1,25 +1,63 @@
 # webhook_server.py
 import os
 import re
+import time
+import hashlib
 import logging
+import threading
+import orjson
 import requests
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
 from html import escape as html_escape
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Dict, Any, Optional, Tuple, List
 
 from flask import Flask, request, jsonify
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 from urllib.parse import urljoin
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 # Odoo RPC (de tu proyecto)
 from odoo_rpc import post_write_multi, read_fields
 
 # -------------------- Flask / logging --------------------
 app = Flask(__name__)
+
+# jsonify y request.get_json vía orjson (C): mismo motor que ya usamos para
+# decodificar Socrata/RUES. En Flask < 2.2 no existe la API de providers y
+# se queda el json stdlib.
+try:
+    from flask.json.provider import JSONProvider
+
+    class _OrjsonProvider(JSONProvider):
+        def dumps(self, obj: Any, **kwargs: Any) -> str:
+            return orjson.dumps(obj).decode()
+
+        def loads(self, s, **kwargs: Any) -> Any:
+            return orjson.loads(s)
+
+    app.json = _OrjsonProvider(app)
+except ImportError:
+    pass
+
+# Logging fuera del request path: el handler del request encola el LogRecord
+# (QueueHandler.prepare formatea en el hilo del request, por eso el formato
+# del lado de la cola es %(message)s pelado) y la escritura a stderr corre
+# en el hilo del QueueListener, así un stderr lento no bloquea webhooks.
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+_log_queue: SimpleQueue = SimpleQueue()
 logging.basicConfig(
-    level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s"
+    level=logging.INFO, format="%(message)s", handlers=[QueueHandler(_log_queue)]
 )
+_log_listener = QueueListener(_log_queue, _log_stream)
+_log_listener.start()
 log = app.logger
 
 # -------------------- Config --------------------
@@ -37,6 +75,14 @@ RUES_DETALLE_URLS = [
 ]
 RUES_BASE_WEB = os.getenv("RUES_BASE_WEB", "https://www.rues.org.co")
 
+# Plantillas pre-partidas en (prefijo, sufijo): concatenar strings evita el
+# parser del mini-lenguaje de str.format en cada request. Un sufijo None
+# marca una plantilla sin placeholder (se usa tal cual, como con .format).
+_RUES_SPLIT = [
+    tuple(tpl.split("{}", 1)) if "{}" in tpl else (tpl, None)
+    for tpl in RUES_DETALLE_URLS
+]
+
 TIMEOUT = int(os.getenv("TIMEOUT", "12"))
 RUES_UA = os.getenv("RUES_USER_AGENT", "Mozilla/5.0 (RUES-Scraper/1.0)")
 
@@ -60,10 +106,143 @@ SESSION_HEADERS = {
     "Referer": f"{RUES_BASE_WEB}/",
 }
 
+# Sesión compartida con pool de conexiones: reutiliza sockets keep-alive
+# hacia datos.gov.co y rues.org.co en vez de pagar TCP+TLS por cada fetch.
+_SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]
+    ),
+)
+_SESSION.mount("https://", _adapter)
+_SESSION.mount("http://", _adapter)
+_SESSION.headers.update(SESSION_HEADERS)
+if SOCRATA_APP_TOKEN:
+    _SESSION.headers["X-App-Token"] = SOCRATA_APP_TOKEN
+
+# Pool compartido para correr en paralelo los fetches independientes de un
+# mismo webhook (validación Odoo + Socrata) sin crear hilos por request.
+_EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# TTL (segundos) del cache de respuestas externas: reintentos de Odoo y
+# fan-out de webhooks suelen repetir el mismo NIT en una ventana corta.
+CACHE_TTL = int(os.getenv("SCRAPER_CACHE_TTL", "60"))
+
+
+def _ttl_bucket() -> int:
+    # El bucket entra en la clave del lru_cache => expiración por ventana
+    return int(time.time() // CACHE_TTL)
+
+
+# Dedup de escrituras: hash de los últimos vals escritos por partner. Si un
+# webhook repetido resuelve exactamente lo mismo, ni el read de validación
+# ni el write a Odoo valen el round-trip.
+PARTNER_CACHE_TTL = int(os.getenv("PARTNER_CACHE_TTL", "600"))
+_PARTNER_CACHE_MAX = 50_000
+_partner_write_cache: Dict[int, Tuple[float, str]] = {}
+_partner_cache_lock = threading.Lock()
+
+
+def _vals_hash(vals: Dict[str, Any]) -> str:
+    return hashlib.blake2b(
+        repr(sorted(vals.items())).encode(), digest_size=16
+    ).hexdigest()
+
+
+def _recent_write_hash(partner_id: int) -> Optional[str]:
+    with _partner_cache_lock:
+        entry = _partner_write_cache.get(partner_id)
+        if entry is None:
+            return None
+        ts, h = entry
+        if time.time() - ts > PARTNER_CACHE_TTL:
+            del _partner_write_cache[partner_id]
+            return None
+        return h
+
+
+def _remember_write(partner_id: int, h: str) -> None:
+    with _partner_cache_lock:
+        if len(_partner_write_cache) >= _PARTNER_CACHE_MAX:
+            # tope simple: vaciar y dejar que se repueble (evita crecer sin límite)
+            _partner_write_cache.clear()
+        _partner_write_cache[partner_id] = (time.time(), h)
+
+
+# Parser HTML: lxml (C) es 5-10x más rápido que html.parser en las páginas
+# de detalle del RUES; si no está instalado se degrada una sola vez.
+_SOUP_PARSER = "lxml"
+
+
+def _make_soup(content: bytes) -> BeautifulSoup:
+    global _SOUP_PARSER
+    try:
+        return BeautifulSoup(content, _SOUP_PARSER)
+    except FeatureNotFound:
+        _SOUP_PARSER = "html.parser"
+        return BeautifulSoup(content, _SOUP_PARSER)
+
+
+# -------------------- Regex precompilados --------------------
+# Patrones calientes compilados una sola vez a nivel de módulo: evita el
+# lookup del cache interno de `re` (LRU de 512) en cada webhook.
+_RE_NON_DIGIT = re.compile(r"\D")
+_RE_WS = re.compile(r"\s+")
+_RE_DOTNET_DATE = re.compile(r"^/Date\((\d+)\)/$")
+# Dispatcher de fechas: decide el formato en un solo match en vez de una
+# cascada de try/except (las excepciones en CPython son caras)
+_RE_DATE_DISPATCH = re.compile(
+    r"^(?:"
+    r"(?P<iso>\d{4}-\d{2}-\d{2})"
+    r"|/Date\((?P<dotnet>\d+)\)/"
+    r"|(?P<d>\d{1,2})/(?P<m>\d{1,2})/(?P<y>\d{4})"
+    # epoch solo con longitud plausible (>=10 dígitos ~ año 2001+): un ISO
+    # compacto de 8 dígitos (20200512) debe caer al fallback fromisoformat,
+    # no interpretarse como segundos de 1970
+    r"|(?P<epoch>\d{10,})"
+    r")"
+)
+_RE_FOUR_EXACT = re.compile(r"^\s*\d{4}\s*$")
+_RE_LBL_SIGLA_EXACT = re.compile(r"^\s*sigla\s*$", re.I)
+_RE_LBL_SIGLA = re.compile(r"sigla", re.I)
+_RE_LBL_FECHA_MATRICULA = re.compile(r"fecha\s+de\s+matr[íi]cula", re.I)
+_RE_LBL_FECHA_INSCRIPCION = re.compile(r"fecha\s+de\s+inscripci[óo]n", re.I)
+_RE_LBL_FECHA_CONSTITUCION = re.compile(r"fecha\s+de\s+constituci[óo]n", re.I)
+_RE_ACT_ECON = re.compile(r"^\s*Actividad\s+econ[oó]mica\s*$", re.I)
+_RE_ONCLICK_DETALLE = re.compile(r"['\"](/detalle/[^'\"]+)['\"]")
+_RE_REP_HDR_REPRESENTACION = re.compile(r"^\s*Representaci[oó]n\s+legal", re.I)
+_RE_REP_HDR_REPRESENTANTE = re.compile(r"^\s*Representante\s+legal", re.I)
+_RE_REP_ANY = re.compile(r"representaci[oó]n\s+legal|representante\s+legal", re.I)
+_RE_REP_WORD = re.compile(r"represent", re.I)
+_RE_REP_BLOCK = re.compile(r"Representaci[oó]n\s+legal.*?\n(.*)", re.I | re.S)
+_RE_REP_FROM = re.compile(r"(Representaci[oó]n\s+legal.*)", re.I | re.S)
+_RE_REP_END = re.compile(
+    r"\n(Actividades?|Actividad econ|Informaci[oó]n|Establecim|Matr[ií]cula|Documentos)\b",
+    re.I,
+)
+_RE_CAPS_NAME = re.compile(
+    r"([A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+(?:\s+[A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+){1,4})"
+)
+
 
 # -------------------- Helpers NIT --------------------
+# Tabla de borrado de no-dígitos ASCII: str.translate es mucho más barato
+# que el motor de regex para los NIT cortos típicos.
+_NON_DIGIT_DEL = str.maketrans(
+    "", "", "".join(chr(i) for i in range(128) if not chr(i).isdigit())
+)
+
+
 def only_digits(s: str) -> str:
-    return re.sub(r"\D", "", s or "")
+    if not s:
+        return ""
+    out = s.translate(_NON_DIGIT_DEL)
+    if not out or out.isdigit():
+        return out
+    # entrada con caracteres no ASCII: limpiar con la regex completa
+    return _RE_NON_DIGIT.sub("", out)
 
 
 def nit_base_sin_dv(s: str) -> str:
@@ -87,75 +266,115 @@ def extract_nit_from_payload(data: Dict[str, Any]) -> Optional[str]:
 def _to_iso_date(value: Any) -> Optional[str]:
     if not value:
         return None
-    s = str(value).strip()
-    try:
-        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
-        return dt.date().isoformat()
-    except Exception:
-        pass
-    m = re.match(r"^/Date\((\d+)\)/$", s)
+    return _to_iso_date_cached(str(value).strip())
+
+
+# Función pura de un string corto y los mismos timestamps se repiten entre
+# webhooks de la misma empresa: candidata ideal para memoizar.
+@lru_cache(maxsize=8192)
+def _to_iso_date_cached(s: str) -> Optional[str]:
+    m = _RE_DATE_DISPATCH.match(s)
     if m:
-        try:
-            ms = int(m.group(1))
-            dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
-            return dt.date().isoformat()
-        except Exception:
-            pass
-    if s.isdigit():
-        try:
-            val = int(s)
-            dt = datetime.fromtimestamp(
-                val / 1000 if val > 10_000_000_000 else val, tz=timezone.utc
-            )
-            return dt.date().isoformat()
-        except Exception:
-            pass
+        if m.group("iso"):
+            try:
+                return date.fromisoformat(m.group("iso")).isoformat()
+            except ValueError:
+                return None
+        if m.group("dotnet"):
+            try:
+                ms = int(m.group("dotnet"))
+                dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+                return dt.date().isoformat()
+            except (OverflowError, OSError, ValueError):
+                return None
+        if m.group("y"):
+            try:
+                return date(
+                    int(m.group("y")), int(m.group("m")), int(m.group("d"))
+                ).isoformat()
+            except ValueError:
+                return None
+        if m.group("epoch") and m.end() == len(s):
+            try:
+                val = int(s)
+                dt = datetime.fromtimestamp(
+                    val / 1000 if val > 10_000_000_000 else val, tz=timezone.utc
+                )
+                return dt.date().isoformat()
+            except (OverflowError, OSError, ValueError):
+                return None
+    # Último recurso: ISO con hora/offset raro (p.ej. sufijo Z)
     try:
-        return datetime.strptime(s, "%d/%m/%Y").date().isoformat()
-    except Exception:
+        return datetime.fromisoformat(s.replace("Z", "+00:00")).date().isoformat()
+    except ValueError:
         return None
 
 
 def _first_nonempty_str(*vals: Any) -> Optional[str]:
     for v in vals:
-        if isinstance(v, str) and v.strip():
-            return v.strip()
+        # type() exacto: las entradas vienen de JSON, no hay subclases de str
+        if v and type(v) is str:
+            s = v.strip()
+            if s:
+                return s
     return None
 
 
 # -------------------- Socrata / RUES API --------------------
-def socrata_headers() -> Dict[str, str]:
-    return {"X-App-Token": SOCRATA_APP_TOKEN} if SOCRATA_APP_TOKEN else {}
+def _matricula_key(row: Dict[str, Any]) -> int:
+    try:
+        return int(row.get("matricula") or 0)
+    except (TypeError, ValueError):
+        return 0
 
 
-def fetch_socrata(nit_base: str) -> Optional[Dict[str, Any]]:
+def _fetch_socrata_network(nit_base: str) -> Optional[Dict[str, Any]]:
     params = {
         "$select": "nit,razon_social,sigla,codigo_camara,matricula",
         "nit": nit_base,
+        # Orden en el servidor (SoQL): normalmente la primera fila ya es la
+        # matrícula más reciente y el sort local es un no-op
+        "$order": "matricula DESC",
         "$limit": 5,
     }
-    r = requests.get(
-        SOCRATA_URL, params=params, headers=socrata_headers(), timeout=TIMEOUT
-    )
+    r = _SESSION.get(SOCRATA_URL, params=params, timeout=TIMEOUT)
     r.raise_for_status()
-    data = r.json() or []
-    log.info(
-        {
-            "event": "socrata_response",
-            "count": len(data),
-            "nit": nit_base,
-            "sample": (data[0] if data else None),
-        }
-    )
+    data = orjson.loads(r.content) or []
+    # %-style: el mensaje solo se formatea si el nivel está habilitado
+    log.info("event=socrata_response count=%d nit=%s", len(data), nit_base)
+    if data and log.isEnabledFor(logging.DEBUG):
+        log.debug("event=socrata_sample nit=%s sample=%s", nit_base, data[0])
     if not data:
         return None
-    try:
-        data.sort(key=lambda x: int((x.get("matricula") or "0") or 0), reverse=True)
-    except Exception:
-        pass
+    if len(data) > 1:
+        # Defensivo: matricula es texto en el dataset y el orden lexicográfico
+        # puede diferir del numérico para longitudes distintas
+        data.sort(key=_matricula_key, reverse=True)
     return data[0]
 
 
+class _EmptyResult(Exception):
+    # Señal interna: el fetch devolvió vacío y NO debe quedar cacheado.
+    # lru_cache no memoriza llamadas que lanzan excepción, así que un
+    # 200-sin-datos transitorio no envenena toda la ventana del TTL.
+    pass
+
+
+@lru_cache(maxsize=2048)
+def _socrata_cached(nit_base: str, _bucket: int) -> Dict[str, Any]:
+    row = _fetch_socrata_network(nit_base)
+    if row is None:
+        raise _EmptyResult
+    return row
+
+
+def fetch_socrata(nit_base: str) -> Optional[Dict[str, Any]]:
+    try:
+        return _socrata_cached(nit_base, _ttl_bucket())
+    except _EmptyResult:
+        return None
+
+
 def build_id_rm(codigo_camara: str, matricula: str) -> Optional[str]:
     try:
         return f"{int(codigo_camara):02d}{int(matricula):010d}"
@@ -178,30 +397,66 @@ def unwrap_rues_registro(js: Dict[str, Any]) -> Dict[str, Any]:
     return js
 
 
-def fetch_rues_detalle_api(id_rm: str) -> Dict[str, Any]:
-    for tpl in RUES_DETALLE_URLS:
-        url = tpl.format(id_rm)
-        try:
-            r = requests.get(url, timeout=TIMEOUT, headers={"User-Agent": RUES_UA})
-            log.info(
-                {"event": "rues_detalle_http", "url": url, "status": r.status_code}
-            )
-            if r.status_code != 200:
-                continue
-            js = r.json() or {}
-            reg = unwrap_rues_registro(js)
-            if isinstance(reg, dict) and reg:
-                return reg
-        except Exception as e:
-            log.warning({"event": "rues_detalle_error", "url": url, "error": str(e)})
-    return {}
+def _fetch_rues_detalle_one(url: str) -> Tuple[Dict[str, Any], str]:
+    try:
+        r = _SESSION.get(url, timeout=TIMEOUT)
+        log.info("event=rues_detalle_http url=%s status=%s", url, r.status_code)
+        if r.status_code != 200:
+            return {}, ""
+        js = orjson.loads(r.content) or {}
+        reg = unwrap_rues_registro(js)
+        if isinstance(reg, dict) and reg:
+            return reg, r.text
+    except Exception as e:
+        log.warning("event=rues_detalle_error url=%s error=%s", url, e)
+    return {}, ""
+
+
+@lru_cache(maxsize=2048)
+def _rues_detalle_cached(id_rm: str, _bucket: int) -> Tuple[Dict[str, Any], str]:
+    reg, raw = _fetch_rues_detalle_api_network(id_rm)
+    if not reg:
+        raise _EmptyResult
+    return reg, raw
+
+
+def fetch_rues_detalle_api(id_rm: str) -> Tuple[Dict[str, Any], str]:
+    try:
+        return _rues_detalle_cached(id_rm, _ttl_bucket())
+    except _EmptyResult:
+        return {}, ""
+
+
+def _fetch_rues_detalle_api_network(id_rm: str) -> Tuple[Dict[str, Any], str]:
+    # Las variantes WEB/WEB2 se consultan en paralelo y gana la primera que
+    # devuelva un registro: si un endpoint está caído ya no bloquea TIMEOUT
+    # segundos antes de probar el siguiente. Devuelve también el JSON crudo
+    # para el fast-path de CIIU sobre texto.
+    #
+    # Van al _EXECUTOR compartido (no a un pool propio): el `with` de un pool
+    # local haría shutdown(wait=True) al retornar y nos dejaría esperando al
+    # perdedor lento de todos modos. Aquí se retorna con el primer registro
+    # no vacío y el perdedor termina solo en background.
+    urls = [
+        prefix if suffix is None else prefix + id_rm + suffix
+        for prefix, suffix in _RUES_SPLIT
+    ]
+    futures = [_EXECUTOR.submit(_fetch_rues_detalle_one, url) for url in urls]
+    for fut in as_completed(futures):
+        reg, raw = fut.result()
+        if reg:
+            for other in futures:
+                if other is not fut:
+                    other.cancel()
+            return reg, raw
+    return {}, ""
 
 
 # -------------------- Extracción campos --------------------
 def extract_name_sigla(detalle: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
-    empresa = (
-        detalle.get("empresa") if isinstance(detalle.get("empresa"), dict) else None
-    )
+    empresa = detalle.get("empresa")
+    if type(empresa) is not dict:
+        empresa = None
     razon_social = _first_nonempty_str(
         detalle.get("razonSocial"),
         detalle.get("razon_social"),
@@ -214,6 +469,20 @@ def extract_name_sigla(detalle: Dict[str, Any]) -> Tuple[Optional[str], Optional
     return razon_social, sigla
 
 
+# Claves candidatas del JSON del RUES, congeladas a nivel de módulo para no
+# reconstruir las mismas listas literales en cada webhook.
+_ACT_KEYS = ("actividadesEconomicas", "actividades", "actividadEconomica")
+_CIIU_ITEM_KEYS = ("codigoCIIU", "ciiu", "codigo", "codigoCiiu")
+_REP_BLOCK_KEYS = (
+    "representantesLegales",
+    "representantes",
+    "apoderados",
+    "junta",
+    "personas",
+)
+_PERSON_NAME_KEYS = ("nombre", "nombreCompleto", "razonSocial", "nombres")
+
+
 def extract_rues_extras(detalle: Dict[str, Any]) -> Dict[str, Optional[str]]:
     # fecha
     fecha = _first_nonempty_str(
@@ -234,58 +503,30 @@ def extract_rues_extras(detalle: Dict[str, Any]) -> Dict[str, Optional[str]]:
 
     # CIIU
     ciiu_code: Optional[str] = None
-    posibles = [
-        detalle.get("actividadesEconomicas"),
-        detalle.get("actividades"),
-        detalle.get("actividadEconomica"),
-    ]
+    posibles = tuple(detalle.get(k) for k in _ACT_KEYS)
     if not any(posibles) and isinstance(detalle.get("empresa"), dict):
         emp = detalle["empresa"]
-        posibles = [
-            emp.get("actividadesEconomicas"),
-            emp.get("actividades"),
-            emp.get("actividadEconomica"),
-        ]
+        posibles = tuple(emp.get(k) for k in _ACT_KEYS)
     for lst in posibles:
         if isinstance(lst, list) and lst:
             item0 = lst[0]
             if isinstance(item0, dict):
                 ciiu_code = _first_nonempty_str(
-                    item0.get("codigoCIIU"),
-                    item0.get("ciiu"),
-                    item0.get("codigo"),
-                    item0.get("codigoCiiu"),
+                    *(item0.get(k) for k in _CIIU_ITEM_KEYS)
                 )
                 if ciiu_code:
                     break
         elif isinstance(lst, dict):
-            ciiu_code = _first_nonempty_str(
-                lst.get("codigoCIIU"),
-                lst.get("ciiu"),
-                lst.get("codigo"),
-                lst.get("codigoCiiu"),
-            )
+            ciiu_code = _first_nonempty_str(*(lst.get(k) for k in _CIIU_ITEM_KEYS))
             if ciiu_code:
                 break
 
     # Representante (si viniera en JSON; lo seguiremos intentando por HTML)
     rep: Optional[str] = None
-    candidatos = [
-        detalle.get("representantesLegales"),
-        detalle.get("representantes"),
-        detalle.get("apoderados"),
-        detalle.get("junta"),
-        detalle.get("personas"),
-    ]
+    candidatos = tuple(detalle.get(k) for k in _REP_BLOCK_KEYS)
     if all(not x for x in candidatos) and isinstance(detalle.get("empresa"), dict):
         emp = detalle["empresa"]
-        candidatos = [
-            emp.get("representantesLegales"),
-            emp.get("representantes"),
-            emp.get("apoderados"),
-            emp.get("junta"),
-            emp.get("personas"),
-        ]
+        candidatos = tuple(emp.get(k) for k in _REP_BLOCK_KEYS)
     nombres: List[str] = []
     for bloque in candidatos:
         if isinstance(bloque, list):
@@ -293,10 +534,7 @@ def extract_rues_extras(detalle: Dict[str, Any]) -> Dict[str, Optional[str]]:
                 if not isinstance(p, dict):
                     continue
                 nombre = _first_nonempty_str(
-                    p.get("nombre"),
-                    p.get("nombreCompleto"),
-                    p.get("razonSocial"),
-                    p.get("nombres"),
+                    *(p.get(k) for k in _PERSON_NAME_KEYS)
                 )
                 rol = _first_nonempty_str(p.get("rol"), p.get("cargo"), p.get("tipo"))
                 if nombre:
@@ -306,15 +544,20 @@ def extract_rues_extras(detalle: Dict[str, Any]) -> Dict[str, Optional[str]]:
                         nombres.append(nombre)
         elif isinstance(bloque, dict):
             nombre = _first_nonempty_str(
-                bloque.get("nombre"),
-                bloque.get("nombreCompleto"),
-                bloque.get("razonSocial"),
-                bloque.get("nombres"),
+                *(bloque.get(k) for k in _PERSON_NAME_KEYS)
             )
             if nombre:
                 nombres.append(nombre)
     if nombres:
-        rep = ", ".join(dict.fromkeys([n.strip() for n in nombres if n]).keys())
+        # dedup con set + lista: sin la lista intermedia ni el dict auxiliar
+        seen = set()
+        unicos = []
+        for n in nombres:
+            n = n.strip()
+            if n and n not in seen:
+                seen.add(n)
+                unicos.append(n)
+        rep = ", ".join(unicos)
 
     return {"fecha_matricula": fecha_iso, "ciiu": ciiu_code, "representante_legal": rep}
 
@@ -322,31 +565,50 @@ def extract_rues_extras(detalle: Dict[str, Any]) -> Dict[str, Optional[str]]:
 # Fallback CIIU “en cualquier parte” del JSON
 _CIIU_KEY_RE = re.compile(r"(ciiu|actividad|codigo.*ciiu)", re.I)
 _CIIU_VAL_RE = re.compile(r"\b(\d{4})\b")
+# Fast-path: un código de 4 dígitos pegado a una clave ciiu/actividad en el
+# JSON crudo; una sola pasada C en vez de recorrer el dict en Python.
+_CIIU_COMBO_RE = re.compile(
+    r'"[^"]*(?:ciiu|actividad)[^"]*"\s*:\s*"?\D{0,40}?(\d{4})', re.I
+)
+
+
+# Último recurso "cualquier 4 dígitos": escanea el documento completo y puede
+# agarrar teléfonos/años. Se puede apagar por ENV sin tocar código.
+CIIU_SCAN_ANY_DIGITS = os.getenv("CIIU_SCAN_ANY_DIGITS", "true").lower() in (
+    "true",
+    "1",
+    "yes",
+)
 
 
-def _iter_kv(obj):
-    def _recur(cur, path):
+def find_first_ciiu_in_text(raw: str) -> Optional[str]:
+    m = _CIIU_COMBO_RE.search(raw or "")
+    return m.group(1) if m else None
+
+
+def _walk(obj):
+    # Recorrido iterativo con stack: sin frames de generador anidados ni la
+    # tupla `path` que ningún consumidor usaba
+    stack = [obj]
+    while stack:
+        cur = stack.pop()
         if isinstance(cur, dict):
             for k, v in cur.items():
-                p = (*path, k)
-                yield p, k, v
-                yield from _recur(v, p)
+                yield k, v
+                if isinstance(v, (dict, list)):
+                    stack.append(v)
         elif isinstance(cur, list):
-            for i, v in enumerate(cur):
-                p = (*path, f"[{i}]")
-                yield from _recur(v, p)
-
-    yield from _recur(obj, ())
+            stack.extend(cur)
 
 
 def find_first_ciiu_anywhere(registro: Dict[str, Any]) -> Optional[str]:
-    for _, k, v in _iter_kv(registro):
+    for k, v in _walk(registro):
         if isinstance(v, str) and _CIIU_KEY_RE.search(k or ""):
             m = _CIIU_VAL_RE.search(v)
             if m:
                 return m.group(1)
         if isinstance(v, dict) and _CIIU_KEY_RE.search(k or ""):
-            for __, kk, vv in _iter_kv(v):
+            for kk, vv in _walk(v):
                 if isinstance(vv, str):
                     m = _CIIU_VAL_RE.search(vv)
                     if m:
@@ -354,7 +616,7 @@ def find_first_ciiu_anywhere(registro: Dict[str, Any]) -> Optional[str]:
         if isinstance(v, list) and _CIIU_KEY_RE.search(k or ""):
             for item in v:
                 if isinstance(item, dict):
-                    for __, kk, vv in _iter_kv(item):
+                    for kk, vv in _walk(item):
                         if isinstance(vv, str):
                             m = _CIIU_VAL_RE.search(vv)
                             if m:
@@ -363,48 +625,91 @@ def find_first_ciiu_anywhere(registro: Dict[str, Any]) -> Optional[str]:
                     m = _CIIU_VAL_RE.search(item)
                     if m:
                         return m.group(1)
-    for __, __k, val in _iter_kv(registro):
-        if isinstance(val, str):
-            m = _CIIU_VAL_RE.search(val)
-            if m:
-                return m.group(1)
+    if CIIU_SCAN_ANY_DIGITS:
+        for _k, val in _walk(registro):
+            if isinstance(val, str):
+                m = _CIIU_VAL_RE.search(val)
+                if m:
+                    return m.group(1)
     return None
 
 
 # -------------------- HTML fallbacks --------------------
-def find_value_by_label_in_soup(soup: BeautifulSoup, label_regex: str) -> Optional[str]:
-    lbl = soup.find(string=re.compile(label_regex, re.I))
-    if not lbl:
-        return None
-    node = getattr(lbl, "parent", None)
-    if node:
-        for sib in node.next_elements:
-            if isinstance(sib, str):
-                val = sib.strip()
-                if val and not re.search(label_regex, val, re.I):
-                    return re.sub(r"\s+", " ", val)
-    return None
+# Tope de bytes de HTML que se materializan y parsean por página: todo lo
+# que extraemos vive en el primer tramo del documento y la salida a Notas
+# ya se recorta a 20000 chars, así que no vale parsear colas de markup.
+HTML_MAX_BYTES = int(os.getenv("HTML_MAX_BYTES", str(256 * 1024)))
+
+
+def _get_html_prefix(url: str) -> Tuple[int, bytes]:
+    """GET con stream=True leyendo a lo sumo HTML_MAX_BYTES del body."""
+    r = _SESSION.get(url, timeout=TIMEOUT, stream=True)
+    try:
+        body = r.raw.read(HTML_MAX_BYTES, decode_content=True)
+    finally:
+        r.close()
+    return r.status_code, body
+# Etiquetas que se resuelven juntas en las páginas de detalle
+_LABEL_PATTERNS = {
+    "sigla_exact": _RE_LBL_SIGLA_EXACT,
+    "sigla": _RE_LBL_SIGLA,
+    "fecha_matricula": _RE_LBL_FECHA_MATRICULA,
+    "fecha_inscripcion": _RE_LBL_FECHA_INSCRIPCION,
+    "fecha_constitucion": _RE_LBL_FECHA_CONSTITUCION,
+}
 
 
-def _extract_representante_from_soup(soup: BeautifulSoup) -> Optional[str]:
+def find_values_by_labels(
+    soup: BeautifulSoup, label_res: Dict[str, "re.Pattern[str]"]
+) -> Dict[str, Optional[str]]:
+    """
+    Resuelve varias etiquetas con UNA pasada sobre los nodos de texto, en vez
+    de un soup.find(string=...) (recorrido completo del árbol) por etiqueta.
+    """
+    pending = dict(label_res)
+    found: Dict[str, Optional[str]] = {}
+    for node in soup.find_all(string=True):
+        if not pending:
+            break
+        text = str(node)
+        hit = None
+        for key, pat in pending.items():
+            if pat.search(text):
+                hit = key
+                break
+        if hit is None:
+            continue
+        pat = pending.pop(hit)
+        value = None
+        parent = node.parent
+        if parent is not None:
+            for sib in parent.next_elements:
+                if isinstance(sib, str):
+                    val = sib.strip()
+                    if val and not pat.search(val):
+                        value = _RE_WS.sub(" ", val)
+                        break
+        found[hit] = value
+    return found
+
+
+def _extract_representante_from_soup(
+    soup: BeautifulSoup, text: Optional[str] = None
+) -> Optional[str]:
     # Heurística rápida (puede faltar si el HTML es distinto)
-    text = soup.get_text("\n", strip=True)
-    m = re.search(r"Representaci[oó]n\s+legal.*?\n(.*)", text, re.I | re.S)
+    # `text` permite reutilizar un get_text ya calculado por el caller
+    if text is None:
+        text = soup.get_text("\n", strip=True)
+    m = _RE_REP_BLOCK.search(text)
     if m:
         block = m.group(1)[:800]
-        nm = re.search(
-            r"([A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+(?:\s+[A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+){1,4})",
-            block,
-        )
+        nm = _RE_CAPS_NAME.search(block)
         if nm:
             return nm.group(1).strip()
     for tr in soup.find_all("tr"):
         row = " ".join(td.get_text(" ", strip=True) for td in tr.find_all(["td", "th"]))
-        if re.search(r"represent", row, re.I):
-            nm = re.search(
-                r"([A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+(?:\s+[A-ZÁÉÍÓÚÑ][A-Za-zÁÉÍÓÚÑáéíóúñ'’\-]+){1,4})",
-                row,
-            )
+        if _RE_REP_WORD.search(row):
+            nm = _RE_CAPS_NAME.search(row)
             if nm:
                 return nm.group(1).strip()
     return None
@@ -414,9 +719,9 @@ def extract_representation_html(soup: BeautifulSoup) -> Optional[str]:
     """
     Devuelve HTML del bloque 'Representación legal'. Si no se encuentra, None.
     """
-    header = soup.find(
-        string=re.compile(r"^\s*Representaci[oó]n\s+legal", re.I)
-    ) or soup.find(string=re.compile(r"^\s*Representante\s+legal", re.I))
+    header = soup.find(string=_RE_REP_HDR_REPRESENTACION) or soup.find(
+        string=_RE_REP_HDR_REPRESENTANTE
+    )
     container = None
     if header:
         cand = getattr(header, "parent", None)
@@ -431,7 +736,7 @@ def extract_representation_html(soup: BeautifulSoup) -> Optional[str]:
     target = None
     for el in scope.find_all(["section", "div", "article"]):
         txt = el.get_text(" ", strip=True)
-        if re.search(r"representaci[oó]n\s+legal|representante\s+legal", txt, re.I):
+        if _RE_REP_ANY.search(txt):
             target = el
             break
     if not target:
@@ -442,12 +747,12 @@ def extract_representation_html(soup: BeautifulSoup) -> Optional[str]:
 
     inner_html = "".join(str(c) for c in target.contents).strip()
     if not inner_html:
-        lines = [
-            html_escape(l.strip())
-            for l in target.get_text("\n", strip=True).splitlines()
-            if l.strip()
-        ]
-        inner_html = "<br>".join(lines)
+        # Escapar el bloque entero de una vez: una llamada C en lugar de
+        # un html_escape por línea (el escape no toca el whitespace)
+        escaped = html_escape(target.get_text("\n", strip=True))
+        inner_html = "<br>".join(
+            l.strip() for l in escaped.splitlines() if l.strip()
+        )
 
     if len(inner_html) > 20000:
         inner_html = inner_html[:20000] + "…"
@@ -455,36 +760,102 @@ def extract_representation_html(soup: BeautifulSoup) -> Optional[str]:
     return f"<div class='rues-representacion-legal'>{inner_html}</div>"
 
 
-def extract_representation_text_fallback(soup: BeautifulSoup) -> str:
+def extract_representation_text_fallback(
+    soup: BeautifulSoup, txt: Optional[str] = None
+) -> str:
     """
     Si no logramos HTML, recorta texto desde 'Representación legal' hasta el siguiente bloque grande.
     """
-    txt = soup.get_text("\n", strip=True)
-    m = re.search(r"(Representaci[oó]n\s+legal.*)", txt, re.I | re.S)
+    if txt is None:
+        txt = soup.get_text("\n", strip=True)
+    m = _RE_REP_FROM.search(txt)
     if not m:
         return html_escape(txt[:20000])  # toda la página recortada
     block = m.group(1)
-    end = re.search(
-        r"\n(Actividades?|Actividad econ|Informaci[oó]n|Establecim|Matr[ií]cula|Documentos)\b",
-        block,
-        re.I,
-    )
+    end = _RE_REP_END.search(block)
     if end:
         block = block[: end.start()]
-    lines = [html_escape(l.strip()) for l in block.splitlines() if l.strip()]
-    html = "<br>".join(lines)
+    # Un solo escape del bloque completo; luego filtrar líneas vacías
+    escaped = html_escape(block)
+    html = "<br>".join(l.strip() for l in escaped.splitlines() if l.strip())
     return html[:20000]
 
 
+def _parse_detail_tree(s2: BeautifulSoup) -> Dict[str, Optional[str]]:
+    """
+    Extrae razón social, sigla, fecha y CIIU de un árbol de detalle ya
+    parseado. Ambos caminos HTML (búsqueda por NIT y detalle por web_id)
+    comparten esta lógica sobre un único árbol por página.
+    """
+    razon_social = None
+    for sel in ["h1", "h2", "p.font-rues-large.filtro__titulo"]:
+        el = s2.select_one(sel)
+        if el and el.get_text(strip=True):
+            razon_social = el.get_text(strip=True)
+            break
+
+    labels = find_values_by_labels(s2, _LABEL_PATTERNS)
+    sigla = labels.get("sigla_exact") or labels.get("sigla")
+    fecha = (
+        labels.get("fecha_matricula")
+        or labels.get("fecha_inscripcion")
+        or labels.get("fecha_constitucion")
+    )
+    fecha_iso = _to_iso_date(fecha)
+
+    ciiu = None
+    act_label = s2.find(string=_RE_ACT_ECON)
+    act_container = None
+    if act_label:
+        cand = getattr(act_label, "parent", None)
+        for _ in range(4):
+            if not cand:
+                break
+            if getattr(cand, "name", None) in ("section", "div", "article"):
+                act_container = cand
+            cand = getattr(cand, "parent", None)
+    if act_container:
+        a_code = act_container.find("a", string=_RE_FOUR_EXACT)
+        if a_code:
+            # El string ya matcheó ^\s*\d{4}\s*$: basta recortarlo
+            ciiu = a_code.get_text().strip()
+        else:
+            m = _CIIU_VAL_RE.search(act_container.get_text(" ", strip=True))
+            if m:
+                ciiu = m.group(1)
+    if not ciiu:
+        a_code = s2.find("a", string=_RE_FOUR_EXACT)
+        if a_code:
+            ciiu = a_code.get_text().strip()
+
+    # Una sola serialización del árbol alimenta el fallback de CIIU y la
+    # heurística de representante
+    page_text = s2.get_text("\n", strip=True)
+    if not ciiu and CIIU_SCAN_ANY_DIGITS:
+        m = _CIIU_VAL_RE.search(page_text)
+        if m:
+            ciiu = m.group(1)
+
+    representante = _extract_representante_from_soup(s2, text=page_text)
+
+    return {
+        "razon_social": razon_social,
+        "sigla": sigla,
+        "fecha_matricula": fecha_iso,
+        "ciiu": ciiu,
+        "representante_legal": representante,
+        # texto ya serializado, reutilizable por el fallback de Notas
+        "page_text": page_text,
+    }
+
+
 def fetch_detail_from_html(nit_base: str) -> Dict[str, Optional[str]]:
-    session = requests.Session()
-    session.headers.update(SESSION_HEADERS)
     search_url = f"{RUES_BASE_WEB}/buscar/RM/{nit_base}"
-    r = session.get(search_url, timeout=TIMEOUT)
-    log.info({"event": "html_search_http", "url": search_url, "status": r.status_code})
+    r = _SESSION.get(search_url, timeout=TIMEOUT)
+    log.info("event=html_search_http url=%s status=%s", search_url, r.status_code)
     if r.status_code != 200:
         return {}
-    soup = BeautifulSoup(r.text, "html.parser")
+    soup = _make_soup(r.content)
 
     razon_social = None
     title = soup.select_one("p.font-rues-large.filtro__titulo")
@@ -505,7 +876,7 @@ def fetch_detail_from_html(nit_base: str) -> Dict[str, Optional[str]]:
     if not detail_href:
         for el in soup.find_all(attrs={"onclick": True}):
             oc = el.get("onclick") or ""
-            m = re.search(r"['\"](/detalle/[^'\"]+)['\"]", oc)
+            m = _RE_ONCLICK_DETALLE.search(oc)
             if m:
                 detail_href = m.group(1)
                 break
@@ -513,78 +884,27 @@ def fetch_detail_from_html(nit_base: str) -> Dict[str, Optional[str]]:
         return {"razon_social": razon_social}
 
     detail_url = urljoin(RUES_BASE_WEB, detail_href)
-    r2 = session.get(detail_url, timeout=TIMEOUT)
-    log.info({"event": "html_detail_http", "url": detail_url, "status": r2.status_code})
-    if r2.status_code != 200:
+    status2, body2 = _get_html_prefix(detail_url)
+    log.info("event=html_detail_http url=%s status=%s", detail_url, status2)
+    if status2 != 200:
         return {"razon_social": razon_social}
 
-    s2 = BeautifulSoup(r2.text, "html.parser")
-
-    name_detail = None
-    for sel in ["h1", "h2", "p.font-rues-large.filtro__titulo"]:
-        el = s2.select_one(sel)
-        if el and el.get_text(strip=True):
-            name_detail = el.get_text(strip=True)
-            break
-    razon_social = razon_social or name_detail
-
-    sigla = find_value_by_label_in_soup(
-        s2, r"^\s*sigla\s*$"
-    ) or find_value_by_label_in_soup(s2, r"sigla")
-    fecha = (
-        find_value_by_label_in_soup(s2, r"fecha\s+de\s+matr[íi]cula")
-        or find_value_by_label_in_soup(s2, r"fecha\s+de\s+inscripci[óo]n")
-        or find_value_by_label_in_soup(s2, r"fecha\s+de\s+constituci[óo]n")
-    )
-    fecha_iso = _to_iso_date(fecha)
-
-    ciiu = None
-    act_label = s2.find(string=re.compile(r"^\s*Actividad\s+econ[oó]mica\s*$", re.I))
-    act_container = None
-    if act_label:
-        cand = getattr(act_label, "parent", None)
-        for _ in range(4):
-            if not cand:
-                break
-            if getattr(cand, "name", None) in ("section", "div", "article"):
-                act_container = cand
-            cand = getattr(cand, "parent", None)
-    if act_container:
-        a_code = act_container.find("a", string=re.compile(r"^\s*\d{4}\s*$"))
-        if a_code:
-            m = re.findall(r"\d{4}", a_code.get_text())
-            if m:
-                ciiu = m[0]
-        if not ciiu:
-            m = re.search(r"\b(\d{4})\b", act_container.get_text(" ", strip=True))
-            if m:
-                ciiu = m.group(1)
-    if not ciiu:
-        a_code = s2.find("a", string=re.compile(r"^\s*\d{4}\s*$"))
-        if a_code:
-            m = re.findall(r"\d{4}", a_code.get_text())
-            if m:
-                ciiu = m[0]
-    if not ciiu:
-        m = re.search(r"\b(\d{4})\b", s2.get_text(" ", strip=True))
-        if m:
-            ciiu = m.group(1)
+    s2 = _make_soup(body2)
 
-    representante = _extract_representante_from_soup(s2) or None
+    base = _parse_detail_tree(s2)
 
     parsed = {
-        "razon_social": razon_social,
-        "sigla": sigla,
-        "fecha_matricula": fecha_iso,
-        "ciiu": ciiu,
-        "representante_legal": representante,
+        "razon_social": razon_social or base["razon_social"],
+        "sigla": base["sigla"],
+        "fecha_matricula": base["fecha_matricula"],
+        "ciiu": base["ciiu"],
+        "representante_legal": base["representante_legal"],
     }
-    log.info(
-        {
-            "event": "html_detail_parsed",
-            "parsed": {k: v for k, v in parsed.items() if v},
-        }
-    )
+    if log.isEnabledFor(logging.INFO):
+        log.info(
+            "event=html_detail_parsed parsed=%s",
+            {k: v for k, v in parsed.items() if v},
+        )
     return parsed
 
 
@@ -593,66 +913,47 @@ def fetch_detail_from_web_id(web_id: Any) -> Dict[str, Optional[str]]:
         did = int(str(web_id).strip())
     except Exception:
         return {}
-
-    url = f"{RUES_BASE_WEB}/detalle/{did}/"
-    r = requests.get(url, headers=SESSION_HEADERS, timeout=TIMEOUT)
-    log.info({"event": "html_detail_by_id_http", "url": url, "status": r.status_code})
-    if r.status_code != 200 or not r.text:
+    try:
+        return _web_detail_cached(did, _ttl_bucket())
+    except _EmptyResult:
         return {}
 
-    s2 = BeautifulSoup(r.text, "html.parser")
 
-    razon_social = None
-    for sel in ["h1", "h2", "p.font-rues-large.filtro__titulo"]:
-        el = s2.select_one(sel)
-        if el and el.get_text(strip=True):
-            razon_social = el.get_text(strip=True)
-            break
+@lru_cache(maxsize=1024)
+def _web_detail_cached(did: int, _bucket: int) -> Dict[str, Optional[str]]:
 
-    sigla = find_value_by_label_in_soup(
-        s2, r"^\s*sigla\s*$"
-    ) or find_value_by_label_in_soup(s2, r"sigla")
-    fecha = (
-        find_value_by_label_in_soup(s2, r"fecha\s+de\s+matr[íi]cula")
-        or find_value_by_label_in_soup(s2, r"fecha\s+de\s+inscripci[óo]n")
-        or find_value_by_label_in_soup(s2, r"fecha\s+de\s+constituci[óo]n")
-    )
-    fecha_iso = _to_iso_date(fecha)
+    url = f"{RUES_BASE_WEB}/detalle/{did}/"
+    status, body = _get_html_prefix(url)
+    log.info("event=html_detail_by_id_http url=%s status=%s", url, status)
+    if status != 200 or not body:
+        raise _EmptyResult
 
-    ciiu = None
-    a_code = s2.find("a", string=re.compile(r"^\s*\d{4}\s*$"))
-    if a_code:
-        mc = re.findall(r"\d{4}", a_code.get_text())
-        if mc:
-            ciiu = mc[0]
-    if not ciiu:
-        m = re.search(r"\b(\d{4})\b", s2.get_text(" ", strip=True))
-        if m:
-            ciiu = m.group(1)
+    s2 = _make_soup(body)
 
-    representante = _extract_representante_from_soup(s2)
+    base = _parse_detail_tree(s2)
 
     # Bloque HTML de Representación legal (o fallback en texto)
     rep_html = extract_representation_html(s2)
     if not rep_html:
-        rep_text_html = extract_representation_text_fallback(soup=s2)
+        rep_text_html = extract_representation_text_fallback(
+            s2, txt=base["page_text"]
+        )
         rep_html = f"<div class='rues-representacion-legal'>{rep_text_html}</div>"
 
     parsed = {
-        "razon_social": razon_social,
-        "sigla": sigla,
-        "fecha_matricula": fecha_iso,
-        "ciiu": ciiu,
-        "representante_legal": representante,  # no se escribe en su campo; solo a comment
+        "razon_social": base["razon_social"],
+        "sigla": base["sigla"],
+        "fecha_matricula": base["fecha_matricula"],
+        "ciiu": base["ciiu"],
+        "representante_legal": base["representante_legal"],  # no se escribe en su campo; solo a comment
         "comment_html": rep_html,
     }
-    log.info(
-        {
-            "event": "html_detail_by_id_parsed",
-            "parsed": {k: v for k, v in parsed.items() if v},
-            "url": url,
-        }
-    )
+    if log.isEnabledFor(logging.INFO):
+        log.info(
+            "event=html_detail_by_id_parsed url=%s parsed=%s",
+            url,
+            {k: v for k, v in parsed.items() if v},
+        )
     return parsed
 
 
@@ -701,21 +1002,27 @@ def receive_webhook():
         }
     )
 
-    # 3) (opcional) validar partner en Odoo
-    try:
-        exists, _ = read_fields(partner_id, ["id"])
-        if not exists:
-            return jsonify({"error": "partner_not_found"}), 404
-    except Exception as e:
-        log.warning(f"No se pudo validar existencia del partner: {e}")
+    # 3) y 4) en paralelo: la validación del partner en Odoo y la consulta
+    # Socrata son independientes; lanzarlas juntas ahorra un round-trip.
+    socrata_future = _EXECUTOR.submit(fetch_socrata, nit_digits)
+    cached_hash = _recent_write_hash(partner_id)
+    if cached_hash is None:
+        # Solo se valida existencia si no le escribimos hace poco: una
+        # escritura exitosa reciente ya prueba que el partner existe.
+        try:
+            exists, _ = read_fields(partner_id, ["id"])
+            if not exists:
+                return jsonify({"error": "partner_not_found"}), 404
+        except Exception as e:
+            log.warning(f"No se pudo validar existencia del partner: {e}")
 
-    # 4) Datos básicos via Socrata
     try:
-        row = fetch_socrata(nit_digits)
+        row = socrata_future.result()
     except requests.HTTPError:
         row = None
 
     detalle: dict = {}
+    detalle_raw = ""
     razon_social = sigla = fecha_matricula = ciiu = representante_legal = None
     comment_html = None
     camara_nombre = None
@@ -725,7 +1032,7 @@ def receive_webhook():
         id_rm = build_id_rm(row["codigo_camara"], row["matricula"])
         log.info({"event": "id_rm_built", "id_rm": id_rm})
         if id_rm:
-            detalle = fetch_rues_detalle_api(id_rm)
+            detalle, detalle_raw = fetch_rues_detalle_api(id_rm)
 
     if detalle:
         camara_nombre = detalle.get("camara") or detalle.get("camaraNombre")
@@ -754,9 +1061,12 @@ def receive_webhook():
         ciiu = extras.get("ciiu") or ciiu
         representante_legal = extras.get("representante_legal") or representante_legal
 
-        # Fallback CIIU agresivo en el JSON
+        # Fallback CIIU agresivo: primero un escaneo regex del JSON crudo,
+        # y solo si no aparece, el recorrido recursivo del dict
         if not ciiu:
-            ciiu = find_first_ciiu_anywhere(detalle)
+            ciiu = find_first_ciiu_in_text(detalle_raw) or find_first_ciiu_anywhere(
+                detalle
+            )
 
         # Si falta CIIU o faltan Notas (comment) con representación, intentar HTML directo por web_id
         if not (ciiu and comment_html):
@@ -830,22 +1140,63 @@ def receive_webhook():
     # Quitar None para no sobreescribir con vacío
     vals = {k: v for k, v in vals.items() if v is not None}
 
+    # Entrega repetida con los mismos vals resueltos: no hay nada nuevo
+    # que escribir en Odoo.
+    incoming_hash = _vals_hash(vals)
+    if cached_hash is not None and incoming_hash == cached_hash:
+        log.info(
+            {"event": "odoo_write_skipped_no_change", "partner_id": partner_id}
+        )
+        return (
+            jsonify(
+                {
+                    "ok": True,
+                    "updated": False,
+                    "cached": True,
+                    "partner_id": partner_id,
+                    "vals": vals,
+                    "razon_social": razon_social,
+                    "sigla": sigla,
+                    "fecha_matricula": fecha_matricula,
+                    "ciiu": ciiu,
+                    "representante_legal_detectado": representante_legal,
+                    "camara": camara_nombre,
+                    "codigo_camara": cod_camara,
+                }
+            ),
+            200,
+        )
+
     log.info(
-        {"event": "odoo_write_multi_attempt", "partner_id": partner_id, "vals": vals}
+        {
+            "event": "odoo_write_multi_attempt",
+            "partner_id": partner_id,
+            "fields": list(vals),
+        }
     )
     ok_write, odoo_response = post_write_multi(partner_id, vals)
+    if ok_write:
+        _remember_write(partner_id, incoming_hash)
 
-    # Enhanced logging to diagnose production issues
+    # Resumen compacto en INFO; los payloads completos (respuesta de Odoo y
+    # vals) solo se serializan cuando DEBUG está habilitado
     log.info(
         {
             "event": "odoo_write_multi_result",
             "partner_id": partner_id,
             "ok": ok_write,
-            "full_response": odoo_response,  # See complete Odoo response
-            "vals_sent": vals,  # Confirm what we attempted to write
-            "field_count": len(vals),  # How many fields were in the request
+            "field_count": len(vals),
         }
     )
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            {
+                "event": "odoo_write_multi_result_detail",
+                "partner_id": partner_id,
+                "full_response": odoo_response,
+                "vals_sent": vals,
+            }
+        )
 
     # If write failed, log detailed error
     if not ok_write:
@@ -887,6 +1238,21 @@ def health():
     return jsonify({"status": "ok"}), 200
 
 
+@app.get("/cache-stats")
+def cache_stats():
+    return (
+        jsonify(
+            {
+                "ttl_seconds": CACHE_TTL,
+                "socrata": _socrata_cached.cache_info()._asdict(),
+                "rues_detalle": _rues_detalle_cached.cache_info()._asdict(),
+                "detalle_web_id": _web_detail_cached.cache_info()._asdict(),
+            }
+        ),
+        200,
+    )
+
+
 if __name__ == "__main__":
     # En prod usa Gunicorn
     app.run(host="0.0.0.0", port=5000, debug=False)